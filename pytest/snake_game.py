@@ -1,6 +1,20 @@
 import pygame
+import argparse
+import asyncio
+import json
+import mmap
+import multiprocessing
+import os
+import queue
 import random
+import struct
 import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # 游戏常量定义
 WINDOW_WIDTH = 800
@@ -9,6 +23,8 @@ GRID_SIZE = 20
 GRID_WIDTH = WINDOW_WIDTH // GRID_SIZE
 GRID_HEIGHT = WINDOW_HEIGHT // GRID_SIZE
 FONT_SIZE = 48
+MIN_SPEED = 5   # 游戏速度下限
+MAX_SPEED = 20  # 游戏速度上限
 
 # 游戏状态常量
 MENU = "menu"
@@ -28,6 +44,16 @@ BLUE = (0, 0, 255)       # 加速食物
 PURPLE = (128, 0, 128)   # 减速食物
 PINK = (255, 192, 203)   # 缩短食物
 ORANGE = (255, 165, 0)   # 无敌食物
+CYAN = (0, 191, 255)     # 冲刺食物
+MAGENTA = (255, 0, 255)  # 双倍分数食物
+
+# 各难度的障碍物数量
+DIFFICULTIES = ("easy", "medium", "hard")
+DIFFICULTY_OBSTACLES = {
+    "easy": 10,    # 简单模式：10个障碍物
+    "medium": 20,  # 中等模式：20个障碍物
+    "hard": 30     # 困难模式：30个障碍物
+}
 
 # 方向常量
 UP = (0, -1)
@@ -35,6 +61,33 @@ DOWN = (0, 1)
 LEFT = (-1, 0)
 RIGHT = (1, 0)
 
+# 食物配置文件（存在时覆盖下面的默认定义）
+FOOD_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'food_config.json')
+
+# 默认食物定义：weight 为相对权重，无需归一化；duration 以游戏刻为单位
+DEFAULT_FOOD_DEFINITIONS = [
+    {'name': 'normal', 'color': RED, 'weight': 0.5, 'score': 1, 'effect': 'normal'},
+    {'name': 'big_red', 'color': RED, 'weight': 0.1, 'score': 3, 'effect': 'big_red'},
+    {'name': 'speed_up', 'color': BLUE, 'weight': 0.1, 'score': 2, 'effect': 'speed', 'speed': 2},
+    {'name': 'speed_down', 'color': PURPLE, 'weight': 0.1, 'score': 2, 'effect': 'speed', 'speed': -2},
+    {'name': 'invincible', 'color': ORANGE, 'weight': 0.05, 'score': 5, 'effect': 'invincible', 'duration': 50},
+    {'name': 'reverse', 'color': (255, 165, 0), 'weight': 0.05, 'score': 3, 'effect': 'reverse'},
+    {'name': 'bonus', 'color': (255, 215, 0), 'weight': 0.05, 'score': 10, 'effect': 'bonus'},
+    {'name': 'turbo', 'color': CYAN, 'weight': 0.03, 'score': 3, 'effect': 'speed', 'speed': 4, 'duration': 30},
+    {'name': 'double_score', 'color': MAGENTA, 'weight': 0.02, 'score': 2, 'effect': 'double_score', 'duration': 80},
+]
+
+# 各效果在食物定义中必须提供的字段
+FOOD_EFFECT_KEYS = {
+    'normal': (),
+    'big_red': (),
+    'speed': ('speed',),
+    'invincible': ('duration',),
+    'reverse': (),
+    'bonus': (),
+    'double_score': ('duration',),
+}
+
 def get_font(size=20):
     """获取系统中文字体"""
     system_fonts = pygame.font.get_fonts()
@@ -68,7 +121,7 @@ class Obstacle:
         self.positions = set()  # 用集合存储障碍物位置
         self.color = GRAY
         
-    def generate(self, snake_pos, food_pos, border_holes, count=20):
+    def generate(self, snake_pos, food_pos, border_holes, count=20, rng=random):
         """生成随机障碍物
         
         Args:
@@ -76,31 +129,10 @@ class Obstacle:
             food_pos: 食物的位置
             border_holes: 边框洞口位置
             count: 障碍物数量
+            rng: 随机数生成器（离线生成关卡时传入带种子的实例）
         """
         self.positions.clear()
-        
-        # 添加墙壁作为障碍物
-        for x in range(GRID_WIDTH):
-            self.positions.add((x, 0))  # 顶部墙壁
-            self.positions.add((x, GRID_HEIGHT - 1))  # 底部墙壁
-        for y in range(GRID_HEIGHT):
-            self.positions.add((0, y))  # 左侧墙壁
-            self.positions.add((GRID_WIDTH - 1, y))  # 右侧墙壁
-        
-        # 移除洞口位置的墙壁
-        for side, pos, size in border_holes:
-            if side == 'top':
-                for x in range(pos - size // (2 * GRID_SIZE), pos + size // (2 * GRID_SIZE)):
-                    self.positions.discard((x, 0))
-            elif side == 'bottom':
-                for x in range(pos - size // (2 * GRID_SIZE), pos + size // (2 * GRID_SIZE)):
-                    self.positions.discard((x, GRID_HEIGHT - 1))
-            elif side == 'left':
-                for y in range(pos - size // (2 * GRID_SIZE), pos + size // (2 * GRID_SIZE)):
-                    self.positions.discard((0, y))
-            elif side == 'right':
-                for y in range(pos - size // (2 * GRID_SIZE), pos + size // (2 * GRID_SIZE)):
-                    self.positions.discard((GRID_WIDTH - 1, y))
+        self.build_walls(border_holes)
         
         # 定义蛇头周围的安全区域
         safe_zone = set()
@@ -119,8 +151,8 @@ class Obstacle:
         max_attempts = 1000  # 防止无限循环
         
         while len(self.positions) < count + 2 * (GRID_WIDTH + GRID_HEIGHT) and attempts < max_attempts:
-            pos = (random.randint(1, GRID_WIDTH-2), 
-                  random.randint(1, GRID_HEIGHT-2))
+            pos = (rng.randint(1, GRID_WIDTH-2), 
+                  rng.randint(1, GRID_HEIGHT-2))
             
             # 确保障碍物不会生成在：
             # 1. 蛇的位置
@@ -134,6 +166,46 @@ class Obstacle:
                 self.positions.add(pos)
             
             attempts += 1
+
+    def build_walls(self, border_holes):
+        """添加四周墙壁并移除洞口位置"""
+        for x in range(GRID_WIDTH):
+            self.positions.add((x, 0))  # 顶部墙壁
+            self.positions.add((x, GRID_HEIGHT - 1))  # 底部墙壁
+        for y in range(GRID_HEIGHT):
+            self.positions.add((0, y))  # 左侧墙壁
+            self.positions.add((GRID_WIDTH - 1, y))  # 右侧墙壁
+        
+        # 移除洞口位置的墙壁
+        for side, pos, size in border_holes:
+            if side == 'top':
+                for x in range(pos - size // (2 * GRID_SIZE), pos + size // (2 * GRID_SIZE)):
+                    self.positions.discard((x, 0))
+            elif side == 'bottom':
+                for x in range(pos - size // (2 * GRID_SIZE), pos + size // (2 * GRID_SIZE)):
+                    self.positions.discard((x, GRID_HEIGHT - 1))
+            elif side == 'left':
+                for y in range(pos - size // (2 * GRID_SIZE), pos + size // (2 * GRID_SIZE)):
+                    self.positions.discard((0, y))
+            elif side == 'right':
+                for y in range(pos - size // (2 * GRID_SIZE), pos + size // (2 * GRID_SIZE)):
+                    self.positions.discard((GRID_WIDTH - 1, y))
+
+    def load(self, border_holes, cells):
+        """从关卡包载入障碍物
+        
+        Args:
+            border_holes: 边框洞口位置
+            cells: 内部障碍物位置
+        """
+        self.positions.clear()
+        self.build_walls(border_holes)
+        self.positions.update(cells)
+
+    def interior_cells(self):
+        """返回墙壁以内的障碍物位置"""
+        return {(x, y) for x, y in self.positions
+                if 0 < x < GRID_WIDTH - 1 and 0 < y < GRID_HEIGHT - 1}
     
     def is_collision(self, pos):
         """检查是否与障碍物碰撞"""
@@ -192,14 +264,15 @@ class Border:
         self.color = WHITE
         self.thickness = 6
 
-    def generate_holes(self, difficulty):
+    def generate_holes(self, difficulty, rng=random):
         """生成随机洞口
         Args:
             difficulty: 游戏难度
+            rng: 随机数生成器
         """
         self.holes = []
         sides = ['top', 'right', 'bottom', 'left']
-        random.shuffle(sides)
+        rng.shuffle(sides)
         
         if difficulty == "easy":
             num_holes = 4
@@ -214,25 +287,25 @@ class Border:
         selected_sides = sides[:num_holes]
         
         for side in selected_sides:
-            if random.random() < large_hole_prob:
+            if rng.random() < large_hole_prob:
                 size = GRID_SIZE * 5
             else:
                 size = GRID_SIZE * 3
             
             if side == 'top':
-                x = random.randint(1, GRID_WIDTH-2)
+                x = rng.randint(1, GRID_WIDTH-2)
                 self.holes.append(('top', x, size))
                 self.holes.append(('bottom', x, size))  # 对应底部洞口
             elif side == 'right':
-                y = random.randint(1, GRID_HEIGHT-2)
+                y = rng.randint(1, GRID_HEIGHT-2)
                 self.holes.append(('right', y, size))
                 self.holes.append(('left', y, size))  # 对应左侧洞口
             elif side == 'bottom':
-                x = random.randint(1, GRID_WIDTH-2)
+                x = rng.randint(1, GRID_WIDTH-2)
                 self.holes.append(('bottom', x, size))
                 self.holes.append(('top', x, size))  # 对应顶部洞口
             elif side == 'left':
-                y = random.randint(1, GRID_HEIGHT-2)
+                y = rng.randint(1, GRID_HEIGHT-2)
                 self.holes.append(('left', y, size))
                 self.holes.append(('right', y, size))  # 对应右侧洞口
     
@@ -278,22 +351,1064 @@ class Border:
                                (0, pos * GRID_SIZE - size//2,
                                 self.thickness, size), 2)
 
+# 关卡包格式：文件头 + 按难度连续排列的定长关卡记录
+# 每条记录：洞口数量(1字节) + 最多8个洞口(边, 位置, 格数各1字节) + 内部障碍物位图
+LEVEL_PACK_MAGIC = b'SNAKELVL'
+LEVEL_PACK_VERSION = 1
+LEVEL_PACK_HEADER = struct.Struct('<8sHHHH' + 'II' * len(DIFFICULTIES))
+HOLE_SIDES = ('top', 'right', 'bottom', 'left')
+MAX_HOLES = 8
+LEVEL_BITMAP_SIZE = (GRID_WIDTH * GRID_HEIGHT + 7) // 8
+LEVEL_RECORD_SIZE = 1 + MAX_HOLES * 3 + LEVEL_BITMAP_SIZE
+DEFAULT_LEVEL_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels.pack')
+SNAKE_START = (GRID_WIDTH // 2, GRID_HEIGHT // 2)
+
+def encode_level(holes, cells):
+    """把洞口和内部障碍物编码成一条定长记录"""
+    record = bytearray(LEVEL_RECORD_SIZE)
+    record[0] = len(holes)
+    for i, (side, pos, size) in enumerate(holes):
+        record[1 + i * 3:4 + i * 3] = bytes((HOLE_SIDES.index(side), pos, size // GRID_SIZE))
+
+    bits = 0
+    for x, y in cells:
+        bits |= 1 << (y * GRID_WIDTH + x)
+    record[1 + MAX_HOLES * 3:] = bits.to_bytes(LEVEL_BITMAP_SIZE, 'little')
+    return bytes(record)
+
+def decode_level(record):
+    """解码一条关卡记录，返回 (洞口列表, 内部障碍物集合)"""
+    holes = []
+    for i in range(record[0]):
+        side, pos, size = record[1 + i * 3:4 + i * 3]
+        holes.append((HOLE_SIDES[side], pos, size * GRID_SIZE))
+
+    cells = set()
+    bits = int.from_bytes(record[1 + MAX_HOLES * 3:], 'little')
+    while bits:
+        low = bits & -bits
+        index = low.bit_length() - 1
+        cells.add((index % GRID_WIDTH, index // GRID_WIDTH))
+        bits ^= low
+    return holes, cells
+
+def generate_level(difficulty, rng=random):
+    """按游戏内相同的规则随机生成一个关卡"""
+    border = Border(None)
+    obstacle = Obstacle(None)
+    border.generate_holes(difficulty, rng)
+    obstacle.generate([SNAKE_START], None, border.holes,
+                      count=DIFFICULTY_OBSTACLES[difficulty], rng=rng)
+    return border.holes, obstacle.interior_cells()
+
+def validate_level(holes, cells):
+    """检查关卡是否公平：出生点安全、所有空地连通、每个洞口都能到达"""
+    obstacle = Obstacle(None)
+    obstacle.load(holes, cells)
+    blocked = obstacle.positions
+
+    # 出生点周围5x5不能有障碍物
+    start_x, start_y = SNAKE_START
+    for dx in range(-2, 3):
+        for dy in range(-2, 3):
+            if (start_x + dx, start_y + dy) in blocked:
+                return False
+
+    # 从出生点广度优先搜索所有可达的格子
+    reached = {SNAKE_START}
+    frontier = deque([SNAKE_START])
+    while frontier:
+        x, y = frontier.popleft()
+        for dx, dy in (UP, DOWN, LEFT, RIGHT):
+            cell = (x + dx, y + dy)
+            if (0 <= cell[0] < GRID_WIDTH and 0 <= cell[1] < GRID_HEIGHT and
+                    cell not in blocked and cell not in reached):
+                reached.add(cell)
+                frontier.append(cell)
+
+    # 不能有被障碍物围死的空地（食物可能刷在里面）
+    if len(reached) != GRID_WIDTH * GRID_HEIGHT - len(blocked):
+        return False
+
+    for side, pos, size in holes:
+        half = size // (2 * GRID_SIZE)
+        if side in ('top', 'bottom'):
+            y = 0 if side == 'top' else GRID_HEIGHT - 1
+            opening = [(x, y) for x in range(pos - half, pos + half)]
+        else:
+            x = 0 if side == 'left' else GRID_WIDTH - 1
+            opening = [(x, y) for y in range(pos - half, pos + half)]
+        if not any(cell in reached for cell in opening):
+            return False
+    return True
+
+def _build_level_chunk(job):
+    """在工作进程中生成一批合格的关卡记录"""
+    difficulty, count, seed = job
+    rng = random.Random(seed)
+    records = bytearray()
+    for _ in range(count):
+        for _ in range(100):
+            holes, cells = generate_level(difficulty, rng)
+            if validate_level(holes, cells):
+                break
+        else:
+            raise RuntimeError(f"无法生成合格的关卡: {difficulty}")
+        records += encode_level(holes, cells)
+    return bytes(records)
+
+def build_level_pack(path, count, workers=None, seed=0, chunk_size=1000):
+    """离线并行生成关卡包
+
+    每批关卡使用由 (seed, 难度, 批次起点) 决定的随机种子，
+    所以同样的参数总能生成同样的文件，与进程数无关。
+
+    Args:
+        path: 输出文件路径
+        count: 每个难度的关卡数
+        workers: 进程数，默认为 CPU 核数
+        seed: 随机种子
+        chunk_size: 每个任务生成的关卡数
+    """
+    jobs = []
+    index = []
+    for position, difficulty in enumerate(DIFFICULTIES):
+        index += [position * count, count]
+        for start in range(0, count, chunk_size):
+            jobs.append((difficulty, min(chunk_size, count - start), f"{seed}-{difficulty}-{start}"))
+
+    header = LEVEL_PACK_HEADER.pack(LEVEL_PACK_MAGIC, LEVEL_PACK_VERSION,
+                                    GRID_WIDTH, GRID_HEIGHT, LEVEL_RECORD_SIZE, *index)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        f.write(header)
+        for records in executor.map(_build_level_chunk, jobs):
+            f.write(records)
+    os.replace(temp_path, path)
+
+class LevelPack:
+    """内存映射的只读关卡包
+
+    打开时只解析文件头，关卡记录在选中时才从映射中切片解码，
+    即使包含上百万个关卡也能立即打开，且几乎不占常驻内存。
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header()
+        except ValueError:
+            self.data.close()
+            raise
+
+    def _read_header(self):
+        path = self.path
+        if len(self.data) < LEVEL_PACK_HEADER.size:
+            raise ValueError(f"关卡包文件损坏: {path}")
+        fields = LEVEL_PACK_HEADER.unpack_from(self.data, 0)
+        magic, version, width, height, record_size = fields[:5]
+        if magic != LEVEL_PACK_MAGIC or version != LEVEL_PACK_VERSION:
+            raise ValueError(f"不是可识别的关卡包: {path}")
+        if (width, height, record_size) != (GRID_WIDTH, GRID_HEIGHT, LEVEL_RECORD_SIZE):
+            raise ValueError(f"关卡包的棋盘尺寸与游戏不一致: {width}x{height}")
+
+        # 难度 -> (起始记录号, 关卡数)
+        self.index = {}
+        for i, difficulty in enumerate(DIFFICULTIES):
+            self.index[difficulty] = (fields[5 + 2 * i], fields[6 + 2 * i])
+        total = max(start + count for start, count in self.index.values())
+        if LEVEL_PACK_HEADER.size + total * LEVEL_RECORD_SIZE > len(self.data):
+            raise ValueError(f"关卡包文件不完整: {path}")
+
+    def count(self, difficulty):
+        return self.index.get(difficulty, (0, 0))[1]
+
+    def get(self, difficulty, number):
+        """按难度和编号读取关卡，返回 (洞口列表, 内部障碍物集合)"""
+        start, count = self.index[difficulty]
+        if not 0 <= number < count:
+            raise IndexError(f"关卡编号超出范围: {number}")
+        offset = LEVEL_PACK_HEADER.size + (start + number) * LEVEL_RECORD_SIZE
+        return decode_level(self.data[offset:offset + LEVEL_RECORD_SIZE])
+
+    def random_level(self, difficulty, rng=random):
+        """随机选一个关卡，返回 (编号, 洞口列表, 内部障碍物集合)"""
+        number = rng.randrange(self.count(difficulty))
+        return (number,) + self.get(difficulty, number)
+
+    def close(self):
+        self.data.close()
+
+# 竞技场模式常量
+ARENA = "arena"
+ARENA_CELL_SIZE = 4  # 竞技场每格像素
+ARENA_WIDTH = WINDOW_WIDTH // ARENA_CELL_SIZE
+ARENA_HEIGHT = WINDOW_HEIGHT // ARENA_CELL_SIZE
+ARENA_BOTS = 500
+ARENA_TICK_RATE = 20
+ARENA_FOOD = -1  # 占用网格中表示食物的值，0 为空，正数为蛇的编号
+
+class FrameProfiler:
+    """记录最近若干帧的耗时（不含等待下一帧的时间）和帧间隔抖动"""
+    def __init__(self, window=120):
+        self.samples = deque(maxlen=window)
+        self.frames = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self._start = 0.0
+        # 抖动：实际帧间隔与目标间隔之差的绝对值
+        self.jitter_frames = 0
+        self.jitter_total = 0.0
+        self.jitter_worst = 0.0
+        self._last_start = None
+        self._period = None
+        self.start_latencies = deque(maxlen=window)  # 开局到第一帧游戏画面的耗时
+        # asyncio 主循环下后台协程每帧的耗时和超出截止时间的情况
+        self.background_frames = 0
+        self.background_total = 0.0
+        self.background_worst = 0.0
+        self.overruns = 0
+        self.overrun_worst = 0.0
+
+    def begin(self, period=None):
+        """记录一帧的开始
+
+        Args:
+            period: 上一帧到这一帧的目标间隔（秒），给出时统计抖动
+        """
+        now = time.perf_counter()
+        if self._last_start is not None and self._period:
+            jitter = abs(now - self._last_start - self._period)
+            self.jitter_frames += 1
+            self.jitter_total += jitter
+            self.jitter_worst = max(self.jitter_worst, jitter)
+        self._last_start = now
+        self._period = period
+        self._start = now
+
+    def end(self):
+        elapsed = time.perf_counter() - self._start
+        self.samples.append(elapsed)
+        self.frames += 1
+        self.total += elapsed
+        self.worst = max(self.worst, elapsed)
+
+    def record_start(self, seconds):
+        self.start_latencies.append(seconds)
+
+    def record_background(self, seconds, overrun):
+        """记录一帧内后台协程的耗时，以及超出帧截止时间的时长"""
+        self.background_frames += 1
+        self.background_total += seconds
+        self.background_worst = max(self.background_worst, seconds)
+        if overrun > 0:
+            self.overruns += 1
+            self.overrun_worst = max(self.overrun_worst, overrun)
+
+    def average_ms(self):
+        """最近窗口内的平均帧耗时（毫秒）"""
+        return sum(self.samples) / len(self.samples) * 1000 if self.samples else 0.0
+
+    def max_ms(self):
+        return max(self.samples) * 1000 if self.samples else 0.0
+
+    def summary(self):
+        if not self.frames:
+            return "没有记录到帧"
+        text = (f"{self.frames} 帧, 平均 {self.total / self.frames * 1000:.2f} ms, "
+                f"最慢 {self.worst * 1000:.2f} ms")
+        if self.jitter_frames:
+            text += (f"; 帧间隔抖动 平均 {self.jitter_total / self.jitter_frames * 1000:.2f} ms, "
+                     f"最大 {self.jitter_worst * 1000:.2f} ms")
+        if self.start_latencies:
+            text += f"; 开局到第一帧 最慢 {max(self.start_latencies) * 1000:.2f} ms"
+        if self.background_total or self.overruns:
+            text += (f"; 后台协程 每帧平均 "
+                     f"{self.background_total / self.background_frames * 1000:.2f} ms, "
+                     f"最多 {self.background_worst * 1000:.2f} ms, "
+                     f"超出截止 {self.overruns} 次 (最多 {self.overrun_worst * 1000:.2f} ms)")
+        return text
+
+class _TimedCoroutine:
+    """包装后台协程，统计它每一步真正占用事件循环的时间
+
+    事件循环每次调用 send/throw 推进协程一步，协程在 await 处挂起时返回，
+    所以挂起等待（网络、磁盘、sleep）的时间不会被计入。
+    """
+    __slots__ = ('coroutine', 'scheduler')
+
+    def __init__(self, coroutine, scheduler):
+        self.coroutine = coroutine
+        self.scheduler = scheduler
+
+    def send(self, value):
+        start = time.perf_counter()
+        try:
+            return self.coroutine.send(value)
+        finally:
+            self.scheduler._account(start)
+
+    def throw(self, *args):
+        start = time.perf_counter()
+        try:
+            return self.coroutine.throw(*args)
+        finally:
+            self.scheduler._account(start)
+
+    def close(self):
+        return self.coroutine.close()
+
+    @property
+    def __name__(self):
+        return self.coroutine.__name__  # 让任务的 repr 显示原协程的名字
+
+    def __await__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+class FrameScheduler:
+    """asyncio 主循环的帧调度器
+
+    按截止时间安排每一帧：用 asyncio.sleep 睡到截止时间，等待期间
+    同一事件循环里的后台协程可以运行。后台协程在每个工作单元之间
+    await idle()，只有当前帧剩余时间超过 reserve 时才会继续。
+    通过 spawn 启动的协程每一步的运行时间都记到这一步所在的帧，
+    运行到截止时间之后的部分记为超时；挂起等待的时间不计入。
+    """
+    def __init__(self, reserve=0.002, spin=0.0):
+        """
+        Args:
+            reserve: 为下一帧保留、后台协程不能占用的时间（秒）
+            spin: 截止前改为逐次让出（忙等）的时间窗口（秒），默认不忙等
+        """
+        self.reserve = reserve
+        self.spin = spin
+        self.deadline = None
+        self.tasks = set()
+        self._frame_started = None
+        # 当前帧内后台协程的耗时和超出截止时间的最大值
+        self.frame_background = 0.0
+        self.frame_overrun = 0.0
+        # 上一帧的统计，在 next_frame 返回后读取
+        self.last_background = 0.0
+        self.last_overrun = 0.0
+
+    def spawn(self, coroutine):
+        """在同一事件循环中启动后台协程"""
+        task = asyncio.get_running_loop().create_task(_TimedCoroutine(coroutine, self))
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self.tasks.discard(task)
+
+    def _account(self, start):
+        """记录后台协程运行的一步
+
+        一步之内不会切换到主循环，所以这一步一定属于当前帧。
+        """
+        now = time.perf_counter()
+        self.frame_background += now - start
+        if self.deadline is not None and now > self.deadline:
+            # 只计这一步自己运行到截止时间之后的部分
+            overrun = now - max(start, self.deadline)
+            self.frame_overrun = max(self.frame_overrun, overrun)
+
+    async def idle(self):
+        """等到当前帧还有足够的空闲时间"""
+        while self.deadline is None or self.deadline - time.perf_counter() < self.reserve:
+            if self._frame_started is None:
+                self._frame_started = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._frame_started)
+
+    async def next_frame(self, rate):
+        """等待下一帧的截止时间"""
+        period = 1 / rate
+        now = time.perf_counter()
+        if self.deadline is None or now - self.deadline > period:
+            self.deadline = now + period  # 第一帧或落后超过一帧时重新对齐
+        else:
+            self.deadline += period
+
+        remaining = self.deadline - now
+        if remaining > self.spin:
+            await asyncio.sleep(remaining - self.spin)
+        while time.perf_counter() < self.deadline:
+            await asyncio.sleep(0)
+
+        self.last_background, self.frame_background = self.frame_background, 0.0
+        self.last_overrun, self.frame_overrun = self.frame_overrun, 0.0
+
+        # 新的一帧开始，唤醒等待空闲时间的后台协程
+        if self._frame_started is not None:
+            self._frame_started.set_result(None)
+            self._frame_started = None
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+class FreeCells:
+    """空格子集合，增删和随机抽取都是 O(1)"""
+    def __init__(self, size, cells=()):
+        self.cells = []
+        self.index = array('i', [-1]) * size  # 格子 -> 在 cells 中的下标
+        for cell in cells:
+            self.add(cell)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return self.index[cell] >= 0
+
+    def add(self, cell):
+        if self.index[cell] < 0:
+            self.index[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def discard(self, cell):
+        i = self.index[cell]
+        if i < 0:
+            return
+        self.index[cell] = -1
+        last = self.cells.pop()
+        if last != cell:
+            self.cells[i] = last
+            self.index[last] = i
+
+    def sample(self, rng=random):
+        """随机取一个空格子（不移除），没有空格子时返回 None"""
+        if not self.cells:
+            return None
+        return self.cells[int(rng.random() * len(self.cells))]
+
+class ArenaSnake:
+    __slots__ = ('id', 'body', 'x', 'y', 'direction', 'length', 'score', 'alive', 'is_bot')
+
+    def __init__(self, snake_id, cell, x, y, direction, is_bot=True):
+        self.id = snake_id
+        self.body = deque([cell])  # 格子编号，头部在左
+        self.x = x
+        self.y = y
+        self.direction = direction
+        self.length = 3
+        self.score = 0
+        self.alive = True
+        self.is_bot = is_bot
+
+class Arena:
+    """多条蛇共享的大棋盘
+
+    所有蛇和食物都记录在同一个占用网格里（每格存放占用者编号），
+    每刻先算出所有蛇的新头部，再一次性批量判定碰撞，
+    开销只与蛇的数量有关，与蛇身长度无关。
+    """
+    def __init__(self, bots=ARENA_BOTS, width=ARENA_WIDTH, height=ARENA_HEIGHT, rng=random):
+        self.width = width
+        self.height = height
+        self.rng = rng
+        self.grid = array('h', [0]) * (width * height)
+        self.free = FreeCells(width * height, range(width * height))
+        self.foods = set()
+        self.food_target = max(1, bots)
+        self.snakes = {}
+        self.next_id = 1
+
+        self.player = self.spawn_snake(is_bot=False)
+        for _ in range(bots):
+            self.spawn_snake()
+        self.refill_food()
+
+    def spawn_snake(self, is_bot=True):
+        """在随机空格子上生成一条蛇"""
+        cell = self.free.sample(self.rng)
+        if cell is None:
+            return None
+        y, x = divmod(cell, self.width)
+        while self.next_id in self.snakes:
+            self.next_id = self.next_id % 32767 + 1  # 编号存放在 16 位网格中
+        snake = ArenaSnake(self.next_id, cell, x, y,
+                           self.rng.choice([UP, DOWN, LEFT, RIGHT]), is_bot)
+        self.next_id = self.next_id % 32767 + 1
+        self.snakes[snake.id] = snake
+        self.grid[cell] = snake.id
+        self.free.discard(cell)
+        return snake
+
+    def refill_food(self):
+        while len(self.foods) < self.food_target and self.free:
+            cell = self.free.sample(self.rng)
+            self.free.discard(cell)
+            self.grid[cell] = ARENA_FOOD
+            self.foods.add(cell)
+
+    def _cell_ahead(self, x, y, direction):
+        x += direction[0]
+        y += direction[1]
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return None
+
+    def steer(self, snake):
+        """简单的机器人：优先吃相邻的食物，否则直行并偶尔转向，避开被占用的格子"""
+        dx, dy = snake.direction
+        choices = [snake.direction, (dy, -dx), (-dy, dx)]  # 直行、左转、右转
+        if self.rng.random() < 0.1:
+            choices[0], choices[1] = choices[1], choices[0]
+
+        fallback = None
+        for direction in choices:
+            cell = self._cell_ahead(snake.x, snake.y, direction)
+            if cell is None:
+                continue
+            if self.grid[cell] == ARENA_FOOD:
+                snake.direction = direction
+                return
+            if self.grid[cell] == 0 and fallback is None:
+                fallback = direction
+        if fallback is not None:
+            snake.direction = fallback
+
+    def step(self):
+        """推进一刻，返回本刻死亡的蛇"""
+        grid = self.grid
+        width = self.width
+        dead = []
+
+        # 1. 计算所有蛇的新头部
+        heads = {}  # 格子 -> 想进入该格的蛇
+        for snake in self.snakes.values():
+            if snake.is_bot:
+                self.steer(snake)
+            cell = self._cell_ahead(snake.x, snake.y, snake.direction)
+            if cell is None:
+                dead.append(snake)
+            else:
+                heads.setdefault(cell, []).append(snake)
+
+        # 2. 尾巴先离开，其他蛇这一刻可以进入刚空出的格子
+        for movers in heads.values():
+            for snake in movers:
+                if len(snake.body) >= snake.length:
+                    tail = snake.body.pop()
+                    grid[tail] = 0
+                    self.free.add(tail)
+
+        # 3. 批量判定：多个头撞到同一格，或目标格被蛇身占用
+        for cell, movers in heads.items():
+            if len(movers) > 1 or grid[cell] > 0:
+                dead.extend(movers)
+                continue
+            snake = movers[0]
+            if grid[cell] == ARENA_FOOD:
+                self.foods.discard(cell)
+                snake.length += 1
+                snake.score += 1
+            else:
+                self.free.discard(cell)
+            grid[cell] = snake.id
+            snake.body.appendleft(cell)
+            snake.y, snake.x = divmod(cell, width)
+
+        # 4. 清除死亡的蛇，蛇身隔一格变成食物
+        for snake in dead:
+            snake.alive = False
+            del self.snakes[snake.id]
+            for i, cell in enumerate(snake.body):
+                if grid[cell] != snake.id:
+                    continue
+                if i % 2:
+                    grid[cell] = ARENA_FOOD
+                    self.foods.add(cell)
+                else:
+                    grid[cell] = 0
+                    self.free.add(cell)
+            if snake.is_bot:
+                self.spawn_snake()
+
+        self.refill_food()
+        return dead
+
+    def check_invariants(self):
+        """检查占用网格、空格子集合和食物集合是否一致，不一致时抛出 AssertionError
+
+        逐格扫描整个棋盘，开销较大，用于调试和测试，不在每刻调用。
+        """
+        size = self.width * self.height
+        assert len(self.grid) == size, "占用网格大小与棋盘不符"
+        assert self.foods.isdisjoint(self.free.cells), "食物格子同时在空格子集合中"
+        for i, cell in enumerate(self.free.cells):
+            assert self.free.index[cell] == i, f"空格子索引错误: {cell}"
+        assert sum(1 for i in self.free.index if i >= 0) == len(self.free), "空格子索引有多余项"
+
+        owned = 0
+        for snake in self.snakes.values():
+            assert snake.alive, f"死亡的蛇仍在棋盘上: {snake.id}"
+            assert snake.body[0] == snake.y * self.width + snake.x, f"蛇头坐标错误: {snake.id}"
+            assert len(snake.body) <= snake.length, f"蛇身超过长度: {snake.id}"
+            assert len(set(snake.body)) == len(snake.body), f"蛇身有重复格子: {snake.id}"
+            for cell in snake.body:
+                assert self.grid[cell] == snake.id, f"格子 {cell} 不属于蛇 {snake.id}"
+            owned += len(snake.body)
+
+        for cell, value in enumerate(self.grid):
+            if value == 0:
+                assert cell in self.free, f"空格子 {cell} 不在空格子集合中"
+            elif value == ARENA_FOOD:
+                assert cell in self.foods, f"食物格子 {cell} 不在食物集合中"
+            else:
+                assert value in self.snakes, f"格子 {cell} 属于不存在的蛇 {value}"
+        assert len(self.free) + len(self.foods) + owned == size, "格子总数不守恒"
+
+    def render(self, screen):
+        size = ARENA_CELL_SIZE
+        width = self.width
+        for cell in self.foods:
+            y, x = divmod(cell, width)
+            pygame.draw.rect(screen, RED, (x * size, y * size, size, size))
+        for snake in self.snakes.values():
+            color = GREEN if snake.is_bot else YELLOW
+            for cell in snake.body:
+                y, x = divmod(cell, width)
+                pygame.draw.rect(screen, color, (x * size, y * size, size, size))
+
+def png_rows(pixels, width, height, pitch):
+    """把按行排列的 RGB 像素整理成 PNG 扫描行（每行前加过滤类型 0）"""
+    view = memoryview(pixels).cast('B')
+    stride = width * 3
+    return b''.join(b'\x00' + view[y * pitch:y * pitch + stride] for y in range(height))
+
+def write_png(path, raw, width, height):
+    """把整理好的扫描行写成 PNG 文件
+
+    压缩用 zlib 完成，压缩期间会释放 GIL，不会卡住主线程
+    （pygame.image.save 在整个编码过程中都持有 GIL）。
+    """
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+        f.write(chunk(b'IEND', b''))
+
+class FrameRecorder:
+    """后台保存画面的录制器
+
+    预先分配固定数量的画面缓冲区循环使用，主循环只做一次 blit 拷贝，
+    取像素、PNG 压缩和写盘都在线程池中完成。没有空闲缓冲区时直接丢弃
+    这一帧并计数。工作线程取出像素后马上归还缓冲区，自己再持有一份扫描行
+    和压缩结果，所以无论录制多久，内存都不会超过 buffers 个画面加上
+    每个工作线程约两个画面大小。
+    """
+    def __init__(self, screen, directory, buffers=8, workers=2):
+        """
+        Args:
+            screen: 要录制的显示画面，用来确定缓冲区的尺寸和像素格式
+            directory: 保存 PNG 序列的目录
+            buffers: 缓冲区数量，决定内存上限
+            workers: 编码线程数
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.free = queue.SimpleQueue()
+        for _ in range(buffers):
+            # 24 位、内存中按 R,G,B 排列的缓冲区，blit 时顺便完成像素格式转换，
+            # 后台线程可以直接读取其中的字节
+            self.free.put(pygame.Surface(screen.get_size(), 0, 24,
+                                         (0x0000ff, 0x00ff00, 0xff0000, 0)))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='capture')
+        self.lock = threading.Lock()
+        self.frames = 0   # 调用 capture 的次数，也是帧编号
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.error = None  # 最近一次失败的异常
+        # 主线程上 capture 的耗时，用来确认录制不会拖慢渲染
+        self.capture_total = 0.0
+        self.capture_worst = 0.0
+
+    def capture(self, surface):
+        """拷贝当前画面并交给后台编码，不会阻塞"""
+        start = time.perf_counter()
+        index = self.frames
+        self.frames += 1
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1  # 编码跟不上，丢弃这一帧
+        else:
+            buffer.blit(surface, (0, 0))
+            self.executor.submit(self._encode, buffer, index)
+        elapsed = time.perf_counter() - start
+        self.capture_total += elapsed
+        self.capture_worst = max(self.capture_worst, elapsed)
+
+    def _encode(self, buffer, index):
+        path = os.path.join(self.directory, f"frame_{index:06d}.png")
+        width, height = buffer.get_size()
+        # 没有人读取 Future 的结果，任何异常都要在这里计数，否则这一帧会悄悄丢失
+        try:
+            try:
+                # get_buffer 包含每行末尾的填充字节，行宽不是 4 的倍数时也能读取
+                raw = png_rows(buffer.get_buffer(), width, height, buffer.get_pitch())
+            finally:
+                self.free.put(buffer)  # 像素已经取出，缓冲区可以马上复用
+            write_png(path, raw, width, height)
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+                self.error = e
+        else:
+            with self.lock:
+                self.written += 1
+
+    def close(self):
+        """等待已提交的帧全部写完"""
+        self.executor.shutdown(wait=True)
+
+    def summary(self):
+        text = (f"录制 {self.frames} 帧: 已保存 {self.written}, 丢弃 {self.dropped}, "
+                f"失败 {self.failed}")
+        if self.error is not None:
+            text += f" (最近一次失败: {self.error!r})"
+        if self.frames:
+            text += (f"; 主线程拷贝 平均 {self.capture_total / self.frames * 1000:.2f} ms, "
+                     f"最慢 {self.capture_worst * 1000:.2f} ms")
+        return text
+
+# 遥测日志：每刻一行，按列存放
+TELEMETRY_MAGIC = b'SNKTLM1\n'
+TELEMETRY_COLUMNS = (
+    ('tick', 'I'),       # 本局的第几刻
+    ('game', 'H'),       # 本次运行中的第几局
+    ('x', 'h'),          # 蛇头位置
+    ('y', 'h'),
+    ('direction', 'b'),  # DIRECTIONS 中的下标
+    ('speed', 'B'),      # 实际帧率
+    ('food', 'b'),       # 本刻吃到的食物在 food_types 中的下标，-1 表示没有
+    ('invincible', 'B'),
+    ('death', 'b'),      # DEATH_CAUSES 中的下标，-1 表示存活
+    ('level', 'i'),      # 本局在关卡包中的编号，-1 表示随机生成
+)
+TELEMETRY_BLOCK = struct.Struct('<II')  # 行数, 压缩后字节数
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+DEATH_CAUSES = ('self', 'obstacle')
+DIRECTION_CODES = {direction: i for i, direction in enumerate(DIRECTIONS)}
+DEATH_CAUSE_CODES = {cause: i for i, cause in enumerate(DEATH_CAUSES)}
+
+class Telemetry:
+    """每刻遥测记录
+
+    记录先写进预分配的定长列数组，攒满一批后交给后台线程压缩写盘，
+    日志文件按大小轮转并只保留最近的若干个。批次用完时覆盖当前批次
+    并计数，不会阻塞主循环，内存占用固定。
+    """
+    def __init__(self, directory, food_types, batch_size=4096, batches=4,
+                 max_bytes=1024 * 1024, max_files=20):
+        """
+        Args:
+            directory: 日志目录
+            food_types: 食物名列表，food 列保存的是其中的下标
+            batch_size: 每批的行数
+            batches: 预分配的批次数量
+            max_bytes: 单个日志文件的大小上限
+            max_files: 最多保留的日志文件数
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.session = time.strftime('%Y%m%d-%H%M%S') + f"-{os.getpid()}"
+        self.meta = {
+            'session': self.session,
+            'columns': TELEMETRY_COLUMNS,
+            'food_types': list(food_types),
+            'directions': DIRECTIONS,
+            'death_causes': DEATH_CAUSES,
+            'byteorder': sys.byteorder,
+        }
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.dropped = 0  # 因后台写盘跟不上而丢弃的行数
+
+        self.free = queue.SimpleQueue()
+        for _ in range(batches - 1):
+            self.free.put(self._new_batch())
+        self.batch = self._new_batch()
+        self.rows = 0
+
+        self.pending = queue.Queue()
+        self.file = None
+        self.file_number = 0
+        self.writer = threading.Thread(target=self._write_loop, name='telemetry', daemon=True)
+        self.writer.start()
+
+    def _new_batch(self):
+        return [array(code, [0]) * self.batch_size for _, code in TELEMETRY_COLUMNS]
+
+    def record(self, *values):
+        """记录一行，参数顺序与 TELEMETRY_COLUMNS 相同"""
+        row = self.rows
+        for column, value in zip(self.batch, values):
+            column[row] = value
+        self.rows = row + 1
+        if self.rows == self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        try:
+            batch = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += self.rows  # 没有空闲批次，覆盖当前批次
+        else:
+            self.pending.put((self.batch, self.rows))
+            self.batch = batch
+        self.rows = 0
+
+    def _open_next_file(self):
+        if self.file:
+            self.file.close()
+        self.file_number += 1
+        path = os.path.join(self.directory, f"{self.session}_{self.file_number:04d}.tlm")
+        self.file = open(path, 'wb')
+        meta = json.dumps(self.meta).encode('utf-8')
+        self.file.write(TELEMETRY_MAGIC + struct.pack('<I', len(meta)) + meta)
+
+        # 目录中（包括以前的会话）只保留最近的 max_files 个文件，
+        # 文件名以会话开始时间开头，按名字排序即按时间排序
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith('.tlm'))
+        for name in names[:-self.max_files]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            batch, rows = item
+            payload = zlib.compress(b''.join(column[:rows].tobytes() for column in batch))
+            if self.file is None or self.file.tell() >= self.max_bytes:
+                self._open_next_file()
+            self.file.write(TELEMETRY_BLOCK.pack(rows, len(payload)) + payload)
+            self.file.flush()
+            self.free.put(batch)
+        if self.file:
+            self.file.close()
+
+    def summary(self):
+        return f"遥测会话 {self.session}: 丢弃 {self.dropped} 行"
+
+    def close(self):
+        """写出未满的批次并等待后台线程结束"""
+        if self.rows:
+            self.pending.put((self.batch, self.rows))
+            self.rows = 0
+        self.pending.put(None)
+        self.writer.join()
+
+def telemetry_sessions(directory):
+    """列出目录中的遥测会话，按时间从早到晚排列"""
+    return sorted({name.rsplit('_', 1)[0] for name in os.listdir(directory)
+                   if name.endswith('.tlm')})
+
+def read_telemetry(path, session=None):
+    """读取一个会话的遥测日志
+
+    不同会话的食物列表可能不同（food_config.json 改过），
+    局数也各自从1开始，所以每次只读取一个会话。
+
+    Args:
+        path: 单个日志文件，或日志目录
+        session: 要读取的会话，默认为目录中最近的会话
+
+    Returns:
+        (columns, meta)：columns 为列名到 array 的字典，meta 为该会话的元数据
+    """
+    if os.path.isdir(path):
+        if session is None:
+            sessions = telemetry_sessions(path)
+            if not sessions:
+                raise ValueError(f"目录中没有遥测日志: {path}")
+            session = sessions[-1]
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if name.endswith('.tlm') and name.rsplit('_', 1)[0] == session)
+    else:
+        paths = [path]
+
+    columns = {}
+    meta = None
+    for file_path in paths:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(TELEMETRY_MAGIC):
+            raise ValueError(f"不是遥测日志文件: {file_path}")
+        offset = len(TELEMETRY_MAGIC)
+        (meta_size,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        file_meta = json.loads(data[offset:offset + meta_size].decode('utf-8'))
+        offset += meta_size
+        if meta is not None and file_meta != meta:
+            raise ValueError(f"遥测日志与同一会话的其他文件不一致: {file_path}")
+        meta = file_meta
+        for name, code in meta['columns']:
+            columns.setdefault(name, array(code))
+
+        while offset + TELEMETRY_BLOCK.size <= len(data):
+            rows, size = TELEMETRY_BLOCK.unpack_from(data, offset)
+            offset += TELEMETRY_BLOCK.size
+            if offset + size > len(data):
+                break  # 写到一半的块（例如程序被强制结束）
+            payload = zlib.decompress(data[offset:offset + size])
+            offset += size
+            start = 0
+            for name, code in meta['columns']:
+                column = array(code)
+                end = start + rows * column.itemsize
+                column.frombytes(payload[start:end])
+                if meta['byteorder'] != sys.byteorder:
+                    column.byteswap()
+                columns[name].extend(column)
+                start = end
+    return columns, meta
+
+class PreparedLevel:
+    """一个准备好的关卡：边框、障碍物和食物都是可以直接换进游戏的实体"""
+    def __init__(self, screen, registry):
+        self.border = Border(screen)
+        self.obstacle = Obstacle(screen)
+        self.food = Food(screen, registry)
+        self.number = None  # 在关卡包中的编号
+
+class LevelPrefetcher:
+    """在后台线程中为每个难度提前准备关卡
+
+    游戏结束和选择难度时调用 prefetch()，开局时 take() 取出准备好的关卡，
+    把其中的实体和游戏里的实体互换，换下来的实体回收后留给下一次准备使用。
+    关卡包由它负责关闭：close() 先等后台线程结束，再关闭内存映射。
+    """
+    def __init__(self, screen, registry, level_pack=None):
+        self.screen = screen
+        self.registry = registry
+        self.level_pack = level_pack
+        self.ready = {}  # 难度 -> PreparedLevel
+        self.spare = []  # 可以复用的 PreparedLevel
+        self.lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+
+    def prefetch(self):
+        """后台准备还没有就绪的难度，已经在准备或全部就绪时直接返回"""
+        if self.thread and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.closed or len(self.ready) == len(DIFFICULTIES):
+                return
+        self.thread = threading.Thread(target=self._run, name='level-prefetch', daemon=True)
+        self.thread.start()
+
+    def _spare_level(self):
+        with self.lock:
+            if self.spare:
+                return self.spare.pop()
+        return PreparedLevel(self.screen, self.registry)
+
+    def _run(self):
+        for difficulty in DIFFICULTIES:
+            with self.lock:
+                if self.closed:
+                    return
+                if difficulty in self.ready:
+                    continue
+            level = self.build(self._spare_level(), difficulty)
+            with self.lock:
+                self.ready[difficulty] = level
+
+    def build(self, level, difficulty):
+        """在给定的实体上生成关卡"""
+        if self.level_pack and self.level_pack.count(difficulty):
+            # 直接从关卡包取一个预先校验过的关卡
+            level.number, holes, cells = self.level_pack.random_level(difficulty)
+            level.border.holes = holes
+            level.obstacle.load(holes, cells)
+        else:
+            level.number = None
+            level.food.randomize_position()
+            level.border.generate_holes(difficulty)  # 根据难度生成洞口
+            level.obstacle.generate([SNAKE_START],
+                                    level.food.position,
+                                    level.border.holes,
+                                    count=DIFFICULTY_OBSTACLES.get(difficulty, 20))  # 默认中等难度
+        level.food.respawn(level.obstacle, [SNAKE_START])
+        return level
+
+    def take(self, difficulty):
+        """取出准备好的关卡，还没有就绪时当场生成"""
+        with self.lock:
+            level = self.ready.pop(difficulty, None)
+        if level is None:
+            level = self.build(self._spare_level(), difficulty)
+        return level
+
+    def recycle(self, level):
+        with self.lock:
+            self.spare.append(level)
+
+    def close(self):
+        """停止后台准备并关闭关卡包
+
+        后台线程可能正在从关卡包读取，必须等它结束后才能关闭内存映射。
+        """
+        with self.lock:
+            self.closed = True
+        if self.thread:
+            self.thread.join()
+        if self.level_pack:
+            self.level_pack.close()
+            self.level_pack = None
+
 class Game:
-    def __init__(self, screen, game_font):
+    def __init__(self, screen, game_font, level_pack=None, arena_bots=ARENA_BOTS):
         self.screen = screen
         self.game_font = game_font
         self.state = MENU
+        self.start_clicked = None  # 点击开始的时间，用于统计开局耗时
+        self.level_number = None  # 当前关卡在关卡包中的编号，便于复现
+        self.arena = None  # 竞技场模式的棋盘
+        self.arena_bots = arena_bots
+        self.profiler = FrameProfiler()  # 由主循环记录每帧耗时
+        self.recorder = None  # 录制模式下的 FrameRecorder
+        self.telemetry = None  # 开启遥测时的 Telemetry
+        self.scheduler = None  # asyncio 主循环下的 FrameScheduler，可用来启动后台协程
+        self.games_played = 0
+        self.game_ticks = 0
+        self.eaten_type = None  # 本刻吃到的食物
+        self.death_cause = None  # 本刻的死亡原因
         self.snake = Snake(screen)
         self.food = Food(screen)
         self.obstacle = Obstacle(screen)
         self.difficulty = None  # 新增难度属性
         self.border = Border(screen)  # 添加边框
+        self.prefetcher = LevelPrefetcher(screen, self.food.registry, level_pack)  # 后台准备下一局
         
         # 创建主菜单按钮
         self.start_button = Button(WINDOW_WIDTH//2 - 100, WINDOW_HEIGHT//2 - 25,
                                  200, 50, "开始游戏", GREEN)
         self.instructions_button = Button(WINDOW_WIDTH//2 - 100, WINDOW_HEIGHT//2 + 50,
                                           200, 50, "游戏说明", BLUE)
+        self.arena_button = Button(WINDOW_WIDTH//2 - 100, WINDOW_HEIGHT//2 + 125,
+                                   200, 50, "竞技场", ORANGE)
         
         # 创建难度选择按钮
         button_width = 150
@@ -321,28 +1436,58 @@ class Game:
         
         # 添加速度滑块
         self.speed_slider = Slider(WINDOW_WIDTH//4, WINDOW_HEIGHT//2 + 80, 
-                                 WINDOW_WIDTH//2, 10, 5, 20, 10)
+                                 WINDOW_WIDTH//2, 10, MIN_SPEED, MAX_SPEED, 10)
         self.game_speed = 10  # 初始游戏速度
+        self.speed_bonus = 0  # 限时速度效果的叠加量
+
+        # 限时效果：在游戏刻上计时，暂停时不会流逝
+        self.effects = TimedEffects()
+        self.effects.register('invincible', self._start_invincible, self._end_invincible)
+        self.effects.register('speed', self._add_speed_bonus, self._remove_speed_bonus)
+        self.effects.register('double_score')
         
         self.instructions_font = get_font(18)  # 使用较小的字体
     
+    def _start_invincible(self, value):
+        self.snake.invincible = True
+
+    def _end_invincible(self, value):
+        self.snake.invincible = self.effects.is_active('invincible')
+
+    def _add_speed_bonus(self, value):
+        self.speed_bonus += value
+
+    def _remove_speed_bonus(self, value):
+        self.speed_bonus -= value
+
+    def get_tick_rate(self):
+        """当前实际帧率（基础速度加上限时效果）"""
+        if self.state == ARENA:
+            return ARENA_TICK_RATE
+        return max(MIN_SPEED, min(MAX_SPEED, self.game_speed + self.speed_bonus))
+
+    def start_arena(self):
+        """进入竞技场模式"""
+        self.arena = Arena(self.arena_bots)
+        self.state = ARENA
+
     def start_new_game(self):
         """开始新游戏时初始化所有元素"""
+        self.start_clicked = time.perf_counter()
+        self.arena = None
+        self.games_played += 1
+        self.game_ticks = 0
+        self.effects.clear()
+        self.speed_bonus = 0
         self.snake.reset()
-        self.food.randomize_position()
-        self.border.generate_holes(self.difficulty)  # 根据难度生成洞口
-        
-        # 根据难度设置障碍物数量
-        obstacle_count = {
-            "easy": 10,    # 简单模式：10个障碍物
-            "medium": 20,  # 中等模式：20个障碍物
-            "hard": 30     # 困难模式：30个障碍物
-        }.get(self.difficulty, 20)  # 默认中等难度
-        
-        self.obstacle.generate([self.snake.get_head_position()],
-                             self.food.position,
-                             self.border.holes,
-                             count=obstacle_count)
+
+        # 换入后台准备好的边框、障碍物和食物，换下来的实体留给下次复用
+        level = self.prefetcher.take(self.difficulty)
+        self.level_number = level.number
+        self.border, level.border = level.border, self.border
+        self.obstacle, level.obstacle = level.obstacle, self.obstacle
+        self.food, level.food = level.food, self.food
+        self.prefetcher.recycle(level)
     
     def handle_events(self):
         for event in pygame.event.get():
@@ -357,6 +1502,8 @@ class Game:
                         self.state = DIFFICULTY
                     elif self.instructions_button.is_clicked(mouse_pos):
                         self.state = "instructions"
+                    elif self.arena_button.is_clicked(mouse_pos):
+                        self.start_arena()
                 
                 elif self.state == DIFFICULTY:
                     if self.easy_button.is_clicked(mouse_pos):
@@ -373,8 +1520,11 @@ class Game:
                         self.start_new_game()
                 
                 elif self.state == GAME_OVER and self.restart_button.is_clicked(mouse_pos):
-                    self.state = DIFFICULTY
-                    self.difficulty = None
+                    if self.arena:
+                        self.start_arena()
+                    else:
+                        self.state = DIFFICULTY
+                        self.difficulty = None
                 
                 elif self.state == PAUSE:
                     if self.continue_button.is_clicked(mouse_pos):
@@ -401,6 +1551,19 @@ class Game:
                         self.snake.direction = RIGHT
                 elif self.state == PAUSE and event.key == pygame.K_ESCAPE:
                     self.state = GAME
+                elif self.state == ARENA:
+                    player = self.arena.player
+                    if event.key == pygame.K_ESCAPE:
+                        self.arena = None
+                        self.state = MENU
+                    elif event.key == pygame.K_UP and player.direction != DOWN:
+                        player.direction = UP
+                    elif event.key == pygame.K_DOWN and player.direction != UP:
+                        player.direction = DOWN
+                    elif event.key == pygame.K_LEFT and player.direction != RIGHT:
+                        player.direction = LEFT
+                    elif event.key == pygame.K_RIGHT and player.direction != LEFT:
+                        player.direction = RIGHT
 
             # 处理滑块事件
             if self.state == PAUSE:
@@ -410,57 +1573,89 @@ class Game:
         return True
         
     def update(self):
+        if self.state == ARENA:
+            self.arena.step()
+            if not self.arena.player.alive:
+                self.snake.score = self.arena.player.score  # 游戏结束画面显示玩家分数
+                self.state = GAME_OVER
+            return
+
+        # 玩家在选择时提前准备下一局；竞技场的结束画面只能重开竞技场，不需要准备
+        if self.state == DIFFICULTY or (self.state == GAME_OVER and self.arena is None):
+            self.prefetcher.prefetch()
+
         if self.state == GAME:
-            head_pos = self.snake.get_head_position()
-            
-            for side, pos, size in self.border.holes:
-                if side == 'left' and head_pos[0] < 0:
-                    if abs(head_pos[1] - pos) < size // GRID_SIZE:
-                        new_y = pos
-                        self.snake.positions = [(GRID_WIDTH - 1, new_y)] + self.snake.positions[:-1]
-                        return
-                elif side == 'right' and head_pos[0] >= GRID_WIDTH:
-                    if abs(head_pos[1] - pos) < size // GRID_SIZE:
-                        new_y = pos
-                        self.snake.positions = [(0, new_y)] + self.snake.positions[:-1]
-                        return
-                elif side == 'top' and head_pos[1] < 0:
-                    if abs(head_pos[0] - pos) < size // GRID_SIZE:
-                        new_x = pos
-                        self.snake.positions = [(new_x, GRID_HEIGHT - 1)] + self.snake.positions[:-1]
-                        return
-                elif side == 'bottom' and head_pos[1] >= GRID_HEIGHT:
-                    if abs(head_pos[0] - pos) < size // GRID_SIZE:
-                        new_x = pos
-                        self.snake.positions = [(new_x, 0)] + self.snake.positions[:-1]
-                        return
-            
-            if not self.snake.update():
+            self.game_ticks += 1
+            self.eaten_type = None
+            self.death_cause = None
+            self.update_game()
+            if self.telemetry:
+                self.record_telemetry()
+
+    def update_game(self):
+        """游戏状态下推进一刻"""
+        self.effects.advance()
+        head_pos = self.snake.get_head_position()
+        
+        for side, pos, size in self.border.holes:
+            if side == 'left' and head_pos[0] < 0:
+                if abs(head_pos[1] - pos) < size // GRID_SIZE:
+                    new_y = pos
+                    self.snake.positions = [(GRID_WIDTH - 1, new_y)] + self.snake.positions[:-1]
+                    return
+            elif side == 'right' and head_pos[0] >= GRID_WIDTH:
+                if abs(head_pos[1] - pos) < size // GRID_SIZE:
+                    new_y = pos
+                    self.snake.positions = [(0, new_y)] + self.snake.positions[:-1]
+                    return
+            elif side == 'top' and head_pos[1] < 0:
+                if abs(head_pos[0] - pos) < size // GRID_SIZE:
+                    new_x = pos
+                    self.snake.positions = [(new_x, GRID_HEIGHT - 1)] + self.snake.positions[:-1]
+                    return
+            elif side == 'bottom' and head_pos[1] >= GRID_HEIGHT:
+                if abs(head_pos[0] - pos) < size // GRID_SIZE:
+                    new_x = pos
+                    self.snake.positions = [(new_x, 0)] + self.snake.positions[:-1]
+                    return
+        
+        if not self.snake.update():
+            self.state = GAME_OVER
+            self.death_cause = 'self'
+        
+        if self.obstacle.is_collision(self.snake.get_head_position()):
+            if not self.snake.invincible and self.state != GAME_OVER:
                 self.state = GAME_OVER
-            
-            if self.obstacle.is_collision(self.snake.get_head_position()):
-                if not self.snake.invincible:
-                    self.state = GAME_OVER
-            
-            head_pos = self.snake.get_head_position()
-            food_size = int(self.food.current_size // GRID_SIZE)
-            
-            food_area = [(self.food.position[0] + dx, self.food.position[1] + dy)
-                        for dx in range(food_size)
-                        for dy in range(food_size)]
-            
-            if head_pos in food_area:
-                score = self.food.food_types[self.food.current_type]['effect'](self)
-                self.snake.score += score
-                while True:
-                    self.food.randomize_position()
-                    food_size = int(self.food.current_size // GRID_SIZE)
-                    new_food_area = [(self.food.position[0] + dx, self.food.position[1] + dy)
-                                   for dx in range(food_size)
-                                   for dy in range(food_size)]
-                    if not any(self.obstacle.is_collision(pos) for pos in new_food_area) and \
-                       not any(pos in self.snake.positions for pos in new_food_area):
-                        break
+                self.death_cause = 'obstacle'
+        
+        head_pos = self.snake.get_head_position()
+        food_size = int(self.food.current_size // GRID_SIZE)
+        
+        food_area = [(self.food.position[0] + dx, self.food.position[1] + dy)
+                    for dx in range(food_size)
+                    for dy in range(food_size)]
+        
+        if head_pos in food_area:
+            self.eaten_type = self.food.current_type
+            # 双倍分数每层额外加一倍，倍数在施加效果前确定，双倍食物本身不翻倍
+            multiplier = 1 + self.effects.stacks.get('double_score', 0)
+            score = self.food.food_types[self.food.current_type]['effect'](self)
+            self.snake.score += score * multiplier
+            self.spawn_food()
+
+    def record_telemetry(self):
+        head_x, head_y = self.snake.get_head_position()
+        self.telemetry.record(
+            self.game_ticks, self.games_played, head_x, head_y,
+            DIRECTION_CODES[self.snake.direction], self.get_tick_rate(),
+            self.food.registry.codes.get(self.eaten_type, -1),
+            self.snake.invincible,
+            DEATH_CAUSE_CODES.get(self.death_cause, -1),
+            -1 if self.level_number is None else self.level_number)
+
+    def spawn_food(self):
+        """重新放置食物，避开障碍物和蛇身"""
+        self.food.respawn(self.obstacle, self.snake.positions)
     
     def render_instructions(self):
         """绘制游戏说明"""
@@ -476,6 +1671,8 @@ class Game:
             ("  粉色方块: 缩短食物，减少长度", PINK),
             ("  橙色方块: 无敌食物，获得短暂无敌", ORANGE),
             ("  大红色方块: 增加更多长度，大小随机", RED),
+            ("  青色方块: 短时间加速", CYAN),
+            ("  洋红方块: 限时双倍分数", MAGENTA),
             ("", WHITE),
             ("边框和洞口：", WHITE),
             ("  黄色标记: 洞口，蛇可以穿过", YELLOW),
@@ -488,7 +1685,7 @@ class Game:
             instruction_text = self.instructions_font.render(text, True, color)
             instruction_rect = instruction_text.get_rect(center=(WINDOW_WIDTH//2, y_offset))
             self.screen.blit(instruction_text, instruction_rect)
-            y_offset += 35  # 调整行间距
+            y_offset += 26  # 调整行间距
 
     def render(self):
         self.screen.fill(BLACK)
@@ -499,6 +1696,7 @@ class Game:
             self.screen.blit(title_text, title_rect)
             self.start_button.draw(self.screen)
             self.instructions_button.draw(self.screen)
+            self.arena_button.draw(self.screen)
         
         elif self.state == "instructions":
             self.render_instructions()
@@ -531,6 +1729,16 @@ class Game:
             score_text = self.game_font.render(f"分数: {self.snake.score}", True, WHITE)
             self.screen.blit(score_text, (10, 10))
             
+        elif self.state == ARENA:
+            self.arena.render(self.screen)
+            score_text = self.game_font.render(f"分数: {self.arena.player.score}", True, WHITE)
+            self.screen.blit(score_text, (10, 10))
+            # 显示蛇的数量和最近的帧耗时
+            stats_text = self.instructions_font.render(
+                f"蛇: {len(self.arena.snakes)}  帧耗时: {self.profiler.average_ms():.1f} ms"
+                f" (最慢 {self.profiler.max_ms():.1f} ms)", True, WHITE)
+            self.screen.blit(stats_text, (10, 60))
+
         elif self.state == GAME_OVER:
             # 显示游戏结束和最终分数
             game_over_text = self.game_font.render("游戏结束!", True, WHITE)
@@ -539,6 +1747,12 @@ class Game:
             score_rect = score_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//3 + 60))
             self.screen.blit(game_over_text, game_over_rect)
             self.screen.blit(score_text, score_rect)
+            if self.arena is None and self.level_number is not None:
+                # 关卡包中的编号，配合难度可以用 LevelPack.get 取回同一关
+                level_text = self.instructions_font.render(
+                    f"关卡: {self.difficulty} #{self.level_number}", True, WHITE)
+                level_rect = level_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//2 + 60))
+                self.screen.blit(level_text, level_rect)
             self.restart_button.draw(self.screen)
             
         elif self.state == PAUSE:
@@ -571,6 +1785,113 @@ class Game:
             self.speed_slider.draw(self.screen)
         
         pygame.display.flip()
+        if self.recorder:
+            # 放在 flip 之后，后台编码与主循环等待下一帧的时间重叠
+            self.recorder.capture(self.screen)
+
+        if self.state == GAME and self.start_clicked is not None:
+            # 从点击开始到第一帧游戏画面显示出来的时间
+            self.profiler.record_start(time.perf_counter() - self.start_clicked)
+            self.start_clicked = None
+
+class _Timer:
+    __slots__ = ('deadline', 'callback')
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+
+class TimerWheel:
+    """以游戏刻为单位的时间轮
+
+    每个定时器按到期刻挂到对应的槽里，每刻只查看当前槽，
+    没有到期的定时器时推进一刻只是一次计数。
+    """
+    def __init__(self, slots=256):
+        self.slots = [[] for _ in range(slots)]
+        self.tick = 0
+        self.pending = 0  # 未触发的定时器数量
+
+    def schedule(self, delay, callback):
+        """在 delay 刻之后调用 callback"""
+        timer = _Timer(self.tick + max(1, int(delay)), callback)
+        self.slots[timer.deadline % len(self.slots)].append(timer)
+        self.pending += 1
+        return timer
+
+    def advance(self):
+        """推进一刻并触发到期的定时器"""
+        self.tick += 1
+        if not self.pending:
+            return
+        index = self.tick % len(self.slots)
+        slot = self.slots[index]
+        if not slot:
+            return
+
+        # 超过一圈的定时器留在槽里等下一圈
+        due = []
+        remaining = []
+        for timer in slot:
+            if timer.deadline <= self.tick:
+                due.append(timer)
+            else:
+                remaining.append(timer)
+        self.slots[index] = remaining
+
+        for timer in due:
+            self.pending -= 1
+            timer.callback()
+
+    def clear(self):
+        for slot in self.slots:
+            slot.clear()
+        self.pending = 0
+
+class TimedEffects:
+    """可叠加的限时效果
+
+    每种效果注册开始/结束回调，每次施加都会增加一层并在时间轮上
+    安排一次到期，多层效果互不干扰，也不需要每刻轮询。
+    """
+    def __init__(self):
+        self.wheel = TimerWheel()
+        self.stacks = {}    # 效果名 -> 当前层数
+        self.handlers = {}  # 效果名 -> (开始回调, 结束回调)
+
+    def register(self, kind, on_start=None, on_end=None):
+        self.handlers[kind] = (on_start, on_end)
+
+    def apply(self, kind, duration, value=None):
+        """施加一层效果，duration 刻后自动结束
+
+        Args:
+            kind: 已注册的效果名
+            duration: 持续刻数
+            value: 传给回调的参数（例如速度变化量）
+        """
+        on_start, _ = self.handlers[kind]
+        self.stacks[kind] = self.stacks.get(kind, 0) + 1
+        if on_start:
+            on_start(value)
+        self.wheel.schedule(duration, lambda: self._expire(kind, value))
+
+    def _expire(self, kind, value):
+        self.stacks[kind] -= 1
+        _, on_end = self.handlers[kind]
+        if on_end:
+            on_end(value)
+
+    def is_active(self, kind):
+        return self.stacks.get(kind, 0) > 0
+
+    def advance(self):
+        self.wheel.advance()
+
+    def clear(self):
+        """清除所有效果（不调用结束回调）"""
+        self.wheel.clear()
+        self.stacks.clear()
 
 class Snake:
     def __init__(self, screen):
@@ -581,18 +1902,12 @@ class Snake:
         self.color = GREEN
         self.head_color = YELLOW
         self.score = 0
-        self.invincible = False
-        self.invincible_time = 0
-        self.invincible_duration = 5000  # 无敌时间5秒
+        self.invincible = False  # 由 Game.effects 维护
 
     def get_head_position(self):
         return self.positions[0]
 
     def update(self):
-        # 更新无敌状态
-        if self.invincible and pygame.time.get_ticks() - self.invincible_time > self.invincible_duration:
-            self.invincible = False
-
         cur = self.get_head_position()
         x, y = self.direction
         new_x = cur[0] + x
@@ -614,6 +1929,7 @@ class Snake:
         self.positions = [(GRID_WIDTH//2, GRID_HEIGHT//2)]
         self.direction = random.choice([UP, DOWN, LEFT, RIGHT])
         self.score = 0
+        self.invincible = False
 
     def render(self):
         # 绘制边框
@@ -654,8 +1970,76 @@ class Snake:
         
         pygame.draw.polygon(self.screen, BLACK, points)
 
+class AliasTable:
+    """Vose 别名表：预处理 O(n)，每次加权抽样 O(1)"""
+    def __init__(self, weights):
+        n = len(weights)
+        if n == 0:
+            raise ValueError("权重列表不能为空")
+        if any(w < 0 for w in weights):
+            raise ValueError("权重不能为负数")
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("权重之和必须大于0")
+
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # 剩下的列（包括浮点误差留下的）概率都是1
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+class FoodRegistry:
+    """食物和道具定义表，按权重用别名表抽样"""
+    def __init__(self, definitions):
+        self.definitions = {}
+        for definition in definitions:
+            definition = dict(definition)
+            if 'name' not in definition or 'effect' not in definition:
+                raise ValueError(f"食物定义缺少 name 或 effect: {definition}")
+            if definition['effect'] not in FOOD_EFFECT_KEYS:
+                raise ValueError(f"未知的食物效果: {definition['effect']}")
+            missing = [key for key in FOOD_EFFECT_KEYS[definition['effect']] if key not in definition]
+            if missing:
+                raise ValueError(f"食物 {definition['name']} 缺少字段: {', '.join(missing)}")
+            definition['color'] = tuple(definition.get('color', RED))
+            definition.setdefault('weight', 1)
+            definition.setdefault('score', 1)
+            self.definitions[definition['name']] = definition
+
+        self.names = list(self.definitions)
+        self.codes = {name: i for i, name in enumerate(self.names)}  # 食物名 -> 下标
+        self.table = AliasTable([self.definitions[name]['weight'] for name in self.names])
+
+    @classmethod
+    def load(cls, path=FOOD_CONFIG_FILE):
+        """从 JSON 配置加载食物定义，文件不存在时使用默认定义"""
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return cls(json.load(f))
+        return cls(DEFAULT_FOOD_DEFINITIONS)
+
+    def sample(self):
+        """随机选一种食物，返回食物名"""
+        return self.names[self.table.sample()]
+
 class Food:
-    def __init__(self, screen):
+    def __init__(self, screen, registry=None):
         self.screen = screen
         self.position = (0, 0)
         self.size_range = {
@@ -665,74 +2049,44 @@ class Food:
         }
         self.current_size = self.size_range['small']
         
-        self.food_types = {
-            'normal': {
-                'color': RED,
-                'probability': 0.5,
-                'score': 1,
-                'effect': self.normal_effect
-            },
-            'big_red': {
-                'color': RED,
-                'probability': 0.1,
-                'score': 3,
-                'effect': self.big_red_effect
-            },
-            'speed_up': {
-                'color': BLUE,
-                'probability': 0.1,
-                'score': 2,
-                'effect': self.speed_up_effect
-            },
-            'speed_down': {
-                'color': PURPLE,
-                'probability': 0.1,
-                'score': 2,
-                'effect': self.speed_down_effect
-            },
-            'invincible': {
-                'color': ORANGE,
-                'probability': 0.05,
-                'score': 5,
-                'effect': self.invincible_effect
-            },
-            'reverse': {
-                'color': (255, 165, 0),
-                'probability': 0.05,
-                'score': 3,
-                'effect': self.reverse_effect
-            },
-            'bonus': {
-                'color': (255, 215, 0),
-                'probability': 0.05,
-                'score': 10,
-                'effect': self.bonus_effect
-            }
-        }
-        self.current_type = 'normal'
-        self.color = self.food_types['normal']['color']
+        # 从注册表构建食物类型，效果名对应 <effect>_effect 方法
+        self.registry = registry or FoodRegistry.load()
+        self.food_types = {}
+        for name, definition in self.registry.definitions.items():
+            effect = getattr(self, f"{definition['effect']}_effect", None)
+            if effect is None:
+                raise ValueError(f"未知的食物效果: {definition['effect']}")
+            self.food_types[name] = dict(definition, effect=effect)
+        self.current_type = self.registry.names[0]
+        self.color = self.food_types[self.current_type]['color']
         self.randomize_position()
 
     def randomize_position(self):
+        # 先决定类型和大小，再按大小确定位置，避免大食物超出边界
+        self.current_type = self.registry.sample()
+        self.color = self.food_types[self.current_type]['color']
+
+        if self.registry.definitions[self.current_type]['effect'] == 'big_red':
+            self.current_size = random.choice(list(self.size_range.values()))
+        else:
+            self.current_size = self.size_range['small']
+
         size_in_grid = int(self.current_size // GRID_SIZE)
         max_x = GRID_WIDTH - size_in_grid
         max_y = GRID_HEIGHT - size_in_grid
-        
         self.position = (random.randint(0, max_x), random.randint(0, max_y))
-        
-        rand = random.random()
-        cumulative_prob = 0
-        for food_type, properties in self.food_types.items():
-            cumulative_prob += properties['probability']
-            if rand <= cumulative_prob:
-                self.current_type = food_type
-                self.color = properties['color']
+
+    def respawn(self, obstacle, snake_positions):
+        """重新随机放置，直到不与障碍物和蛇身重叠"""
+        while True:
+            self.randomize_position()
+            food_size = int(self.current_size // GRID_SIZE)
+            new_food_area = [(self.position[0] + dx, self.position[1] + dy)
+                           for dx in range(food_size)
+                           for dy in range(food_size)]
+            if not any(obstacle.is_collision(pos) for pos in new_food_area) and \
+               not any(pos in snake_positions for pos in new_food_area):
                 break
-        
-        if self.current_type == 'big_red':
-            self.current_size = random.choice(list(self.size_range.values()))
-        else:
-            self.current_size = self.size_range['small']
 
     def render(self):
         size = int(self.current_size)
@@ -760,21 +2114,27 @@ class Food:
         game.snake.length += 1
         return self.food_types[self.current_type]['score']
 
-    def speed_up_effect(self, game):
-        game.game_speed = min(20, game.game_speed + 2)
+    def speed_effect(self, game):
+        # speed 为速度变化量（可为负），配置了 duration 时为限时效果
+        properties = self.food_types[self.current_type]
+        if properties.get('duration'):
+            game.effects.apply('speed', properties['duration'], properties['speed'])
+        else:
+            game.game_speed = max(MIN_SPEED, min(MAX_SPEED, game.game_speed + properties['speed']))
         game.snake.length += 1
-        return self.food_types[self.current_type]['score']
+        return properties['score']
 
-    def speed_down_effect(self, game):
-        game.game_speed = max(5, game.game_speed - 2)
+    def invincible_effect(self, game):
+        properties = self.food_types[self.current_type]
+        game.effects.apply('invincible', properties['duration'])
         game.snake.length += 1
-        return self.food_types[self.current_type]['score']
+        return properties['score']
 
-    def invincible_effect(self, game):
-        game.snake.invincible = True
-        game.snake.invincible_time = pygame.time.get_ticks()
+    def double_score_effect(self, game):
+        properties = self.food_types[self.current_type]
+        game.effects.apply('double_score', properties['duration'])
         game.snake.length += 1
-        return self.food_types[self.current_type]['score']
+        return properties['score']
 
     def big_red_effect(self, game):
         # 根据食物大小增加蛇的长度
@@ -783,7 +2143,68 @@ class Food:
         game.snake.length += length_increase
         return self.food_types[self.current_type]['score'] * int(size_multiplier)
 
+def set_timer_resolution(enabled):
+    """Windows 默认计时器精度约 15.6 ms，运行期间提高到 1 ms，其他系统无需处理"""
+    if sys.platform != 'win32':
+        return
+    import ctypes
+    winmm = ctypes.WinDLL('winmm')
+    if enabled:
+        winmm.timeBeginPeriod(1)
+    else:
+        winmm.timeEndPeriod(1)
+
+async def run_async(game, spin=0.0):
+    """asyncio 版本的主循环，帧之间的空闲时间留给后台协程
+
+    Args:
+        game: 游戏实例
+        spin: 截止前忙等的时间窗口（秒），见 FrameScheduler
+    """
+    scheduler = FrameScheduler(spin=spin)
+    game.scheduler = scheduler
+    set_timer_resolution(True)
+    running = True
+    try:
+        while running:
+            game.profiler.begin(1 / game.get_tick_rate())
+            running = game.handle_events()
+            game.update()
+            game.render()
+            game.profiler.end()
+            await scheduler.next_frame(game.get_tick_rate())
+            game.profiler.record_background(scheduler.last_background, scheduler.last_overrun)
+    finally:
+        set_timer_resolution(False)
+        await scheduler.close()
+        game.scheduler = None
+
 def main():
+    parser = argparse.ArgumentParser(description='贪吃蛇游戏')
+    parser.add_argument('--levels', default=DEFAULT_LEVEL_PACK,
+                        help='关卡包路径，文件不存在时随机生成关卡')
+    parser.add_argument('--build-levels', metavar='PATH',
+                        help='离线生成关卡包到 PATH 后退出')
+    parser.add_argument('--count', type=int, default=1000, help='每个难度生成的关卡数')
+    parser.add_argument('--workers', type=int, default=None, help='生成关卡使用的进程数')
+    parser.add_argument('--seed', type=int, default=0, help='生成关卡的随机种子')
+    parser.add_argument('--bots', type=int, default=ARENA_BOTS, help='竞技场模式的机器人数量')
+    parser.add_argument('--profile', action='store_true', help='退出时打印帧耗时统计')
+    parser.add_argument('--capture', metavar='DIR', help='把每帧画面录制为 PNG 序列保存到 DIR')
+    parser.add_argument('--capture-buffers', type=int, default=8,
+                        help='录制缓冲区数量（决定录制占用的内存上限）')
+    parser.add_argument('--telemetry', metavar='DIR', help='把每刻的遥测记录写入 DIR')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='使用 asyncio 主循环，按截止时间精确控制帧率')
+    parser.add_argument('--spin', type=float, default=0.0,
+                        help='asyncio 主循环在截止前忙等的毫秒数，换取更低的抖动（默认不忙等）')
+    args = parser.parse_args()
+
+    if args.build_levels:
+        build_level_pack(args.build_levels, args.count, workers=args.workers, seed=args.seed)
+        print(f"已生成关卡包: {args.build_levels}")
+        return
+
     # 初始化Pygame
     pygame.init()
     pygame.font.init()
@@ -796,19 +2217,45 @@ def main():
     game_font = get_font()  # 使用中文字体
     
     # 创建游戏实例
-    game = Game(screen, game_font)
+    level_pack = None
+    if os.path.exists(args.levels):
+        try:
+            level_pack = LevelPack(args.levels)
+        except (ValueError, OSError) as e:
+            # 关卡包损坏或与当前棋盘不匹配时退回随机生成
+            print(f"无法加载关卡包，改为随机生成关卡: {e}")
+    game = Game(screen, game_font, level_pack, arena_bots=args.bots)
+    if args.capture:
+        game.recorder = FrameRecorder(screen, args.capture, buffers=args.capture_buffers)
+    if args.telemetry:
+        game.telemetry = Telemetry(args.telemetry, game.food.registry.names)
     clock = pygame.time.Clock()
     
     # 游戏主循环
-    running = True
-    while running:
-        running = game.handle_events()
-        game.update()
-        game.render()
-        clock.tick(game.game_speed)  # 使用游戏速度控制帧率
+    if args.use_async:
+        asyncio.run(run_async(game, spin=args.spin / 1000))
+    else:
+        running = True
+        while running:
+            game.profiler.begin(1 / game.get_tick_rate())
+            running = game.handle_events()
+            game.update()
+            game.render()
+            game.profiler.end()
+            clock.tick(game.get_tick_rate())  # 使用游戏速度控制帧率
 
+    if args.profile:
+        print(f"帧耗时: {game.profiler.summary()}")
+    if game.recorder:
+        game.recorder.close()
+        print(game.recorder.summary())
+    if game.telemetry:
+        game.telemetry.close()
+        print(game.telemetry.summary())
+    game.prefetcher.close()  # 等后台线程结束后关闭关卡包
     pygame.quit()
     sys.exit()
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # 打包成 exe 后生成关卡包需要
     main()
\ No newline at end of file